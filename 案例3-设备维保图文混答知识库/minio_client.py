@@ -2,14 +2,27 @@ import boto3
 import os
 from botocore.exceptions import ClientError, NoCredentialsError
 from botocore.config import Config
+from boto3.s3.transfer import TransferConfig
 from dotenv import load_dotenv
 import json
 import re
 import hashlib
+import threading
 
 # 加载环境变量
 load_dotenv()
 
+# S3连接池大小，需大于图片并发上传线程数
+MAX_POOL_CONNECTIONS = 64
+
+# 超过该大小(8MB)的文件才使用分片上传
+MULTIPART_THRESHOLD = 8 * 1024 * 1024
+
+# bucket名称清理用的预编译正则
+# 匹配任何不在允许集合(a-z, 0-9, ., -)中的字符
+_UNSAFE_BUCKET_CHARS = re.compile(r'[^a-z0-9.\-]')
+_REPEATED_DASHES = re.compile(r'-+')
+
 class MinIOClient:
     def __init__(self):
         """
@@ -27,6 +40,10 @@ class MinIOClient:
         self.secret_key = os.getenv('MINIO_SECRET_KEY')
         self.bucket_name = os.getenv('MINIO_BUCKET_NAME', 'ragflow-images')
 
+        # 已确认存在并设置过访问策略的bucket，避免每次上传都重复检查
+        self._verified_buckets = set()
+        self._bucket_lock = threading.Lock()
+
         if not all([self.endpoint, self.access_key, self.secret_key]):
             raise ValueError("缺少MinIO配置。请在.env文件中设置MINIO_ENDPOINT、MINIO_ACCESS_KEY和MINIO_SECRET_KEY")
 
@@ -39,7 +56,11 @@ class MinIOClient:
             region_name='us-east-1',  # MinIO不需要真实的region
             config=Config(
                 signature_version='s3v4',
-                s3={'addressing_style': 'path'}
+                s3={'addressing_style': 'path'},
+                # 扩大连接池并开启keep-alive，使并发上传复用已建立的连接
+                max_pool_connections=MAX_POOL_CONNECTIONS,
+                tcp_keepalive=True,
+                retries={'max_attempts': 3, 'mode': 'adaptive'}
             )
         )
 
@@ -56,30 +77,39 @@ class MinIOClient:
         """
         bucket = bucket_name or self.bucket_name
 
-        try:
-            # 检查bucket是否存在
-            self.s3_client.head_bucket(Bucket=bucket)
-            print(f"Bucket '{bucket}' 已存在")
-        except ClientError as e:
-            error_info = e.response.get('Error', {})
-            code = str(error_info.get('Code', ''))
-            status = e.response.get('ResponseMetadata', {}).get('HTTPStatusCode')
-
-            if code in {'404', 'NoSuchBucket', 'NotFound'} or status == 404:
-                # bucket不存在，创建它
-                print(f"创建Bucket '{bucket}'...")
-                self._create_bucket(bucket)
-            elif status == 400: 
-                # 一些MinIO环境中head_bucket会返回400，改为尝试创建并处理已存在情况
-                print(f"head_bucket返回400，尝试创建Bucket '{bucket}' 进行回退检查...")
-                self._create_bucket(bucket)
-            else:
-                print(f"检查Bucket状态失败: {e}")
-                raise
-
-        # 设置公开访问策略
-        self.set_public_read_policy(bucket)
-        return bucket
+        if bucket in self._verified_buckets:
+            return bucket
+
+        with self._bucket_lock:
+            # 加锁后再次检查，避免并发上传时重复检查同一个bucket
+            if bucket in self._verified_buckets:
+                return bucket
+
+            try:
+                # 检查bucket是否存在
+                self.s3_client.head_bucket(Bucket=bucket)
+                print(f"Bucket '{bucket}' 已存在")
+            except ClientError as e:
+                error_info = e.response.get('Error', {})
+                code = str(error_info.get('Code', ''))
+                status = e.response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+
+                if code in {'404', 'NoSuchBucket', 'NotFound'} or status == 404:
+                    # bucket不存在，创建它
+                    print(f"创建Bucket '{bucket}'...")
+                    self._create_bucket(bucket)
+                elif status == 400: 
+                    # 一些MinIO环境中head_bucket会返回400，改为尝试创建并处理已存在情况
+                    print(f"head_bucket返回400，尝试创建Bucket '{bucket}' 进行回退检查...")
+                    self._create_bucket(bucket)
+                else:
+                    print(f"检查Bucket状态失败: {e}")
+                    raise
+
+            # 设置公开访问策略
+            self.set_public_read_policy(bucket)
+            self._verified_buckets.add(bucket)
+            return bucket
 
     def _create_bucket(self, bucket_name):
         """
@@ -119,7 +149,7 @@ class MinIOClient:
         try:
             self.s3_client.put_bucket_policy(
                 Bucket=bucket_name,
-                Policy=json.dumps(policy)
+                Policy=json.dumps(policy, separators=(',', ':'))  # 紧凑格式，去掉多余空白
             )
             print(f"Bucket '{bucket_name}' 已设置为公开读取")
         except Exception as e:
@@ -145,16 +175,35 @@ class MinIOClient:
         self.create_bucket_if_not_exists(bucket)
 
         try:
-            # 上传文件
-            with open(file_path, 'rb') as file_data:
-                self.s3_client.upload_fileobj(
-                    file_data,
-                    bucket,
-                    object_key,
-                    ExtraArgs={
-                        'ContentType': 'image/png',  # 可以根据文件类型动态设置
-                        'ACL': 'public-read'  # 设置为公开读取
-                    }
+            extra_args = {
+                'ContentType': 'image/png',  # 可以根据文件类型动态设置
+                'ACL': 'public-read'  # 设置为公开读取
+            }
+
+            if os.path.getsize(file_path) > MULTIPART_THRESHOLD:
+                # 大文件使用分片上传
+                with open(file_path, 'rb') as file_data:
+                    self.s3_client.upload_fileobj(
+                        file_data,
+                        bucket,
+                        object_key,
+                        ExtraArgs=extra_args,
+                        Config=TransferConfig(
+                            multipart_threshold=MULTIPART_THRESHOLD,
+                            multipart_chunksize=MULTIPART_THRESHOLD,
+                            use_threads=True,
+                            max_concurrency=8
+                        )
+                    )
+            else:
+                # 小文件直接put_object，跳过分片上传的额外开销
+                with open(file_path, 'rb') as file_data:
+                    data = file_data.read()
+                self.s3_client.put_object(
+                    Bucket=bucket,
+                    Key=object_key,
+                    Body=data,
+                    **extra_args
                 )
 
             # 生成公开访问URL
@@ -259,6 +308,14 @@ def get_minio_client():
             return None
     return _minio_client
 
+def reset_minio_client():
+    """
+    丢弃当前的MinIO客户端单例，下次调用get_minio_client时重新创建
+    （例如fork出的子进程不能复用父进程的boto3客户端）
+    """
+    global _minio_client
+    _minio_client = None
+
 def init_minio_bucket(pdf_filename=None, custom_bucket_name=None):
     """
     初始化MinIO bucket，为PDF文档创建专用bucket
@@ -285,18 +342,17 @@ def init_minio_bucket(pdf_filename=None, custom_bucket_name=None):
         safe_name = base_name.lower()
         
         # 2. 替换非法字符为横杠 (保留 a-z, 0-9, ., -)
-        # regex matches ANY char that is NOT in the allowed set
-        safe_name = re.sub(r'[^a-z0-9.\-]', '-', safe_name)
+        safe_name = _UNSAFE_BUCKET_CHARS.sub('-', safe_name)
         
-        # 3. 如果结果为空或全是横杠（例如纯中文文件名），使用MD5哈希
+        # 3. 如果结果为空或全是横杠（例如纯中文文件名），使用哈希（8位十六进制）
         if not safe_name.replace('-', '').replace('.', ''):
-            name_hash = hashlib.md5(base_name.encode('utf-8')).hexdigest()[:8]
+            name_hash = hashlib.blake2b(base_name.encode('utf-8'), digest_size=4).hexdigest()
             bucket_name = f"ragflow-{name_hash}"
         else:
             # 去除首尾的特殊符号
             safe_name = safe_name.strip('.-')
             # 避免连续的横杠
-            safe_name = re.sub(r'-+', '-', safe_name)
+            safe_name = _REPEATED_DASHES.sub('-', safe_name)
             bucket_name = f"ragflow-{safe_name}"
 
         # 4. 确保长度合规 (最大255，但为了安全截取63字符)
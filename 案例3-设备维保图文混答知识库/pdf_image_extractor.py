@@ -5,9 +5,124 @@ import shutil
 import sys
 from PIL import Image
 import io
+import re
+import hashlib
+import queue
+import threading
+from collections import defaultdict, deque
 from minio_client import get_minio_client, init_minio_bucket
 
-def extract_images_from_pdf(pdf_path, pdf_filename=None, custom_bucket_name=None):
+# 图片上传线程池大小（MinIO并发过高反而会降低吞吐，控制在16~32之间）
+MAX_UPLOAD_WORKERS = 16
+
+# 待上传图片队列长度上限，限制同时驻留内存的图片数量
+UPLOAD_QUEUE_SIZE = 32
+
+# 单张图片上传失败后的额外重试次数
+UPLOAD_RETRIES = 1
+
+# 页面文本中需要清理的行首数字前缀
+_NUMBER_PREFIX = re.compile(r'^\d+\s*\n', re.MULTILINE)
+
+def _is_maintenance_page(text):
+    """
+    判断页面是否符合维修案例格式：包含"设备名称"，或同时包含"机型"和"故障名称"
+    """
+    return "设备名称" in text or ("机型" in text and "故障名称" in text)
+
+def _group_images_by_page(extracted_images):
+    """
+    将图片信息按页码分组，保持每页内的原始顺序
+
+    返回:
+    - 字典 {页码: 图片信息列表}
+    """
+    images_by_page = defaultdict(list)
+    for img in extracted_images:
+        images_by_page[img["page"]].append(img)
+    return images_by_page
+
+def _iter_page_images(doc):
+    """
+    逐页逐张生成PDF中的图片，每次只在内存中保留一张图片的字节数据
+
+    参数:
+    - doc: 已打开的fitz文档对象
+
+    返回:
+    - 生成器，每项包含page、img_idx、xref、image_bytes、ext；
+      若该xref之前已生成过，则image_bytes和ext为None
+    """
+    # xref级缓存：已成功提取的xref不再重复解码，提取失败的xref也不再重试
+    seen_xrefs = set()
+    failed_xrefs = set()
+    for page_idx in range(len(doc)):
+        page = doc[page_idx]
+        print(f"处理第{page_idx+1}页...")
+
+        image_list = page.get_images(full=True)
+        print(f"第{page_idx+1}页发现{len(image_list)}张图片")
+
+        for img_idx, img in enumerate(image_list):
+            xref = img[0]
+            if xref in failed_xrefs:
+                continue
+            if xref in seen_xrefs:
+                yield {"page": page_idx + 1, "img_idx": img_idx, "xref": xref, "image_bytes": None, "ext": None}
+                continue
+
+            try:
+                base_image = doc.extract_image(xref)
+            except Exception as e:
+                print(f"提取图片出错: {str(e)}")
+                failed_xrefs.add(xref)
+                continue
+
+            seen_xrefs.add(xref)
+            yield {
+                "page": page_idx + 1,
+                "img_idx": img_idx,
+                "xref": xref,
+                "image_bytes": base_image["image"],
+                "ext": base_image["ext"]
+            }
+
+def _upload_worker(upload_queue, upload_results, minio_client, bucket_name):
+    """
+    上传线程：从队列中取出图片并上传到MinIO，直到取到结束标记None
+    去重后一张图片可能对应多处引用，因此上传失败时在本线程内额外重试
+
+    参数:
+    - upload_queue: 待上传图片队列，元素为(job_idx, image_bytes, object_key, content_type)
+    - upload_results: 上传结果，成功时追加(job_idx, url)
+    - minio_client: 共享的MinIO客户端（boto3底层client线程安全）
+    - bucket_name: 目标bucket名称
+    """
+    while True:
+        task = upload_queue.get()
+        if task is None:
+            break
+
+        job_idx, image_bytes, object_key, content_type = task
+        for attempt in range(UPLOAD_RETRIES + 1):
+            try:
+                image_url = minio_client.upload_image_bytes(
+                    image_bytes=image_bytes,
+                    object_key=object_key,
+                    content_type=content_type,
+                    bucket_name=bucket_name
+                )
+                upload_results.append((job_idx, image_url))
+                print(f"成功提取并上传图片: {object_key}")
+                print(f"图片URL: {image_url}")
+                break
+            except Exception as e:
+                if attempt < UPLOAD_RETRIES:
+                    print(f"上传图片出错，重试: {object_key}, {str(e)}")
+                else:
+                    print(f"上传图片出错: {object_key}, {str(e)}")
+
+def extract_images_from_pdf(pdf_path, pdf_filename=None, custom_bucket_name=None, upload_workers=MAX_UPLOAD_WORKERS):
     """
     提取PDF中的图片和文本，返回带有图片位置标记的增强文本
 
@@ -15,6 +130,7 @@ def extract_images_from_pdf(pdf_path, pdf_filename=None, custom_bucket_name=None
     - pdf_path: PDF文件路径
     - pdf_filename: PDF文件名，用于创建MinIO bucket（可选）
     - custom_bucket_name: 自定义Bucket名称（可选，优先使用）
+    - upload_workers: 图片上传线程数（可选，多进程处理时应按进程数分摊）
     """
     print(f"正在处理PDF: {pdf_path}")
 
@@ -41,78 +157,119 @@ def extract_images_from_pdf(pdf_path, pdf_filename=None, custom_bucket_name=None
     doc = None
     extracted_text = []
     extracted_images = []
+    # 上传任务元数据（不保存图片字节，字节数据只在有界队列中短暂停留）
+    upload_jobs = []
+    # 每次出现的图片记录，通过job索引指向实际上传的图片（重复图片共享同一个上传任务）
+    image_entries = []
+    # 两级去重：同一xref直接复用；不同xref但内容相同时按哈希复用
+    xref_to_job = {}
+    digest_to_job = {}
     page_count = 0
     
     try:
         # 先尝试打开PDF并提取所有内容，避免多次操作PDF对象
+        # 按路径打开时由MuPDF按需读取文件，不会在Python中保留整份PDF的字节副本；
+        # 不要改为stream=方式打开，那样反而需要先把整个文件读入内存
         doc = fitz.open(pdf_path)
         page_count = len(doc)
         print(f"PDF打开成功，共{page_count}页")
         
-        # 一次性提取所有页面的文本和图片
+        # 提取所有页面的文本
         for page_idx in range(page_count):
-            page = doc[page_idx]
-            print(f"处理第{page_idx+1}页...")
-            
-            # 获取页面文本
-            text = page.get_text()
-            extracted_text.append({"page": page_idx+1, "text": text})
-            
-            # 提取图片
-            image_list = page.get_images(full=True)
-            print(f"第{page_idx+1}页发现{len(image_list)}张图片")
-            
-            # 处理当前页的图片
-            for img_idx, img in enumerate(image_list):
-                try:
-                    xref = img[0]
-                    base_image = doc.extract_image(xref)
-                    image_bytes = base_image["image"]
-
-                    # 生成有意义的图片名称，避免随机字符被LLM修改
-                    # 格式: {PDF文件名}_page{页码}_img{图片序号}_v1.png
-                    pdf_base_name = os.path.splitext(os.path.basename(pdf_path))[0]
-                    # 移除特殊字符，只保留字母数字和下划线
-                    safe_name = ''.join(c for c in pdf_base_name if c.isalnum() or c in '_-').strip()
-                    if not safe_name:
-                        safe_name = 'document'
-
-                    image_filename = f"{safe_name}_page{page_idx+1}_img{img_idx+1}_v1.png"
-
-                    # 确定内容类型
-                    content_type = f"image/{base_image['ext']}"
-
-                    # 直接上传到MinIO
-                    image_url = minio_client.upload_image_bytes(
-                        image_bytes=image_bytes,
-                        object_key=image_filename,
-                        content_type=content_type,
-                        bucket_name=bucket_name
-                    )
-
-                    # 记录图片信息（不再需要temp_path，因为直接上传到MinIO）
+            extracted_text.append({"page": page_idx+1, "text": doc[page_idx].get_text()})
+
+        # 生成有意义的图片名称，避免随机字符被LLM修改
+        # 格式: {PDF文件名}_page{页码}_img{图片序号}_v1.png
+        pdf_base_name = os.path.splitext(os.path.basename(pdf_path))[0]
+        # 移除特殊字符，只保留字母数字和下划线
+        safe_name = ''.join(c for c in pdf_base_name if c.isalnum() or c in '_-').strip()
+        if not safe_name:
+            safe_name = 'document'
+
+        # 启动上传线程：边提取边上传，队列满时提取端阻塞，内存占用上限约为队列长度×单张图片大小
+        upload_queue = queue.Queue(maxsize=UPLOAD_QUEUE_SIZE)
+        upload_results = deque()
+        workers = [
+            threading.Thread(
+                target=_upload_worker,
+                args=(upload_queue, upload_results, minio_client, bucket_name),
+                daemon=True
+            )
+            for _ in range(upload_workers)
+        ]
+        for worker in workers:
+            worker.start()
+
+        try:
+            for item in _iter_page_images(doc):
+                xref = item["xref"]
+                page_num = item["page"]
+
+                # 同一文档中相同的xref指向同一张图片，无需重复提取
+                if item["image_bytes"] is None:
+                    image_entries.append({"page": page_num, "job": xref_to_job[xref]})
+                    continue
+
+                # 内容哈希去重（例如每页重复出现的公司logo）
+                digest = hashlib.blake2b(item["image_bytes"], digest_size=16).digest()
+                if digest in digest_to_job:
+                    xref_to_job[xref] = digest_to_job[digest]
+                    image_entries.append({"page": page_num, "job": digest_to_job[digest]})
+                    continue
+
+                image_filename = f"{safe_name}_page{page_num}_img{item['img_idx']+1}_v1.png"
+
+                job_idx = len(upload_jobs)
+                upload_jobs.append({
+                    "filename": image_filename,
+                    "ext": item["ext"]
+                })
+                xref_to_job[xref] = job_idx
+                digest_to_job[digest] = job_idx
+                image_entries.append({"page": page_num, "job": job_idx})
+
+                upload_queue.put((job_idx, item["image_bytes"], image_filename, f"image/{item['ext']}"))
+        finally:
+            # 通知上传线程结束并等待全部上传完成
+            for _ in workers:
+                upload_queue.put(None)
+            for worker in workers:
+                worker.join()
+
+            # 即使提取中途出错也记录已上传的图片，供异常处理中的回退逻辑使用
+            print(f"共{len(image_entries)}处图片，去重后上传{len(upload_jobs)}张")
+            uploaded = dict(upload_results)
+
+            # 按原始顺序记录图片信息（不再需要temp_path，因为直接上传到MinIO）
+            lost_count = 0
+            for entry in image_entries:
+                idx = entry["job"]
+                if idx in uploaded:
+                    job = upload_jobs[idx]
                     extracted_images.append({
-                        "filename": image_filename,
-                        "page": page_idx + 1,
-                        "content_type": base_image["ext"],
-                        "url": image_url
+                        "filename": job["filename"],
+                        "page": entry["page"],
+                        "content_type": job["ext"],
+                        "url": uploaded[idx]
                     })
-                    print(f"成功提取并上传图片: {image_filename}")
-                    print(f"图片URL: {image_url}")
-                except Exception as e:
-                    print(f"提取图片出错: {str(e)}")
-        
+                else:
+                    lost_count += 1
+            if lost_count:
+                print(f"警告：有{lost_count}处图片因上传失败未能加入文档")
+
         # 关闭文档，防止后续引用出错
         doc.close()
         doc = None
         
         # 现在我们有了所有的文本和图片，开始构建增强文本
         enhanced_text = []
+
+        # 按页码分组图片，避免每页都遍历全部图片
+        images_by_page = _group_images_by_page(extracted_images)
         
         # 检查是否为维修案例文档
         is_maintenance_doc = any(
-            "设备名称" in page_data["text"] or
-            ("机型" in page_data["text"] and "故障名称" in page_data["text"])
+            _is_maintenance_page(page_data["text"])
             for page_data in extracted_text
         )
         
@@ -126,24 +283,26 @@ def extract_images_from_pdf(pdf_path, pdf_filename=None, custom_bucket_name=None
                 page_text = page_data["text"].strip()
 
                 # 清理不需要的数字前缀
-                import re
-                page_text = re.sub(r'^\d+\s*\n', '', page_text, flags=re.MULTILINE)
+                page_text = _NUMBER_PREFIX.sub('', page_text)
 
                 # 为当前页面创建独立的文档内容
                 page_content = []
                 page_content.append(page_text)
 
                 # 添加图片（HTML格式用于渲染）
-                page_images = [img for img in extracted_images if img["page"] == page_num]
+                page_images = images_by_page.get(page_num, ())
                 if page_images:
                     page_content.append("\n### 相关图片\n")
                     for img in page_images:
                         page_content.append(f"<img src=\"{img['url']}\" alt=\"维修图片\" width=\"300\">")
                 
                 # 将页面内容添加到页面文档列表
+                # blob为一次性编码好的UTF-8字节，写文件和上传RAGFlow时直接复用
+                content = "\n".join(page_content)
                 page_documents.append({
                     "page": page_num,
-                    "content": "\n".join(page_content),
+                    "content": content,
+                    "blob": content.encode('utf-8'),
                     "title": f"维修案例第{page_num}页"
                 })
             
@@ -157,8 +316,7 @@ def extract_images_from_pdf(pdf_path, pdf_filename=None, custom_bucket_name=None
                 page_text = page_data["text"].strip()
 
                 # 清理不需要的数字前缀
-                import re
-                page_text = re.sub(r'^\d+\s*\n', '', page_text, flags=re.MULTILINE)
+                page_text = _NUMBER_PREFIX.sub('', page_text)
 
                 # 添加文本
                 paragraphs = page_text.split('\n\n')
@@ -167,7 +325,7 @@ def extract_images_from_pdf(pdf_path, pdf_filename=None, custom_bucket_name=None
                         enhanced_text.append(para.strip())
 
                 # 查找该页的图片
-                page_images = [img for img in extracted_images if img["page"] == page_num]
+                page_images = images_by_page.get(page_num, ())
 
                 # 添加图片
                 if page_images:
@@ -183,9 +341,10 @@ def extract_images_from_pdf(pdf_path, pdf_filename=None, custom_bucket_name=None
         if extracted_images:
             print("使用已提取的图片构建文本...")
             enhanced_text = []
+            images_by_page = _group_images_by_page(extracted_images)
             
             for page_num in range(1, page_count + 1):
-                page_images = [img for img in extracted_images if img["page"] == page_num]
+                page_images = images_by_page.get(page_num, ())
                 
                 if page_images:
                     enhanced_text.append(f"## 第{page_num}页图片\n")
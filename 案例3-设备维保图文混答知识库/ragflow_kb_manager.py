@@ -3,13 +3,32 @@ from ragflow_sdk.modules.chat import Chat
 import os
 import time
 import sys
+from concurrent.futures import ThreadPoolExecutor
+
+# 文档上传并发线程数和每批文档数
+UPLOAD_WORKERS = 8
+UPLOAD_BATCH_SIZE = 4
+
+# 每次提交解析的文档数
+PARSE_BATCH_SIZE = 16
+
+def _chunks(items, size):
+    """
+    将列表按固定大小切分为多个批次
+
+    参数:
+    - items: 待切分的列表
+    - size: 每批的元素个数
+    """
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
 
 def create_ragflow_resources_multi_docs(page_documents, page_files, pdf_filename, api_key, base_url="http://localhost:8080", custom_dataset_name=None, custom_assistant_name=None):
     """
     使用多个独立页面文档创建RAGFlow知识库和聊天助手
 
     参数:
-    - page_documents: 页面文档列表，每个元素包含page、content、title
+    - page_documents: 页面文档列表，每个元素包含page、content、title，以及可选的blob（content的UTF-8编码）
     - page_files: 页面文件路径列表
     - pdf_filename: PDF文件名
     - api_key: RAGFlow API密钥
@@ -93,25 +112,33 @@ def create_ragflow_resources_multi_docs(page_documents, page_files, pdf_filename
         for page_doc, page_file in zip(page_documents, page_files):
             print(f"准备上传第{page_doc['page']}页文档: {page_file}")
 
-            encoded_text = page_doc['content'].encode('utf-8')
+            # 优先复用提取阶段已编码好的字节
+            encoded_text = page_doc.get('blob') or page_doc['content'].encode('utf-8')
             docs_to_upload.append({
                 "display_name": page_file,
                 "blob": encoded_text
             })
 
-        # 批量上传所有页面文档
-        print(f"批量上传{len(docs_to_upload)}个页面文档...")
-        dataset.upload_documents(docs_to_upload)
+        # 分批并发上传所有页面文档
+        print(f"分批并发上传{len(docs_to_upload)}个页面文档...")
+        with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as executor:
+            uploaded_batches = list(executor.map(
+                dataset.upload_documents,
+                _chunks(docs_to_upload, UPLOAD_BATCH_SIZE)
+            ))
         print("所有页面文档上传成功")
 
         # 等待文档解析完成
         print("开始解析文档...")
-        docs = dataset.list_documents()
+        docs = [doc for batch in uploaded_batches for doc in batch]
         doc_ids = [doc.id for doc in docs if hasattr(doc, 'id')]
         print(f"开始解析文档，ID: {doc_ids}")
 
         if doc_ids:
-            dataset.async_parse_documents(doc_ids)
+            # 分批提交解析任务，避免单次请求提交过多文档
+            for doc_id_batch in _chunks(doc_ids, PARSE_BATCH_SIZE):
+                dataset.async_parse_documents(doc_id_batch)
+                time.sleep(0.05)
             print("文档上传成功，正在解析...")
 
             # 等待文档解析完成
@@ -119,21 +146,19 @@ def create_ragflow_resources_multi_docs(page_documents, page_files, pdf_filename
             max_wait_time = 300  # 最长等待5分钟
             start_time = time.time()
 
+            poll_interval = 2  # 初始轮询间隔，之后按指数退避增长
+
             while not all_done and (time.time() - start_time) < max_wait_time:
-                all_done = True
+                # 每轮只请求一次文档列表，在本地按ID过滤状态
+                doc_status_map = {d.id: d.run for d in dataset.list_documents(page_size=len(doc_ids))}
                 for doc_id in doc_ids:
-                    docs_check = dataset.list_documents(id=doc_id)
-                    if docs_check and len(docs_check) > 0:
-                        doc_status = docs_check[0].run
-                        print(f"文档 {doc_id} 状态: {doc_status}")
-                        if doc_status != "DONE":
-                            all_done = False
-                    else:
-                        all_done = False
+                    print(f"文档 {doc_id} 状态: {doc_status_map.get(doc_id)}")
+                all_done = all(doc_status_map.get(doc_id) == "DONE" for doc_id in doc_ids)
 
                 if not all_done:
-                    print("文档仍在解析中，等待10秒...")
-                    time.sleep(10)
+                    print(f"文档仍在解析中，等待{poll_interval:.0f}秒...")
+                    time.sleep(poll_interval)
+                    poll_interval = min(30, poll_interval * 1.5)
 
             print("文档解析完成！")
 
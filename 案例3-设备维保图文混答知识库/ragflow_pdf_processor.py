@@ -4,15 +4,101 @@
 import argparse
 import os
 import json
+import multiprocessing as mp
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from dotenv import load_dotenv
-from pdf_image_extractor import extract_images_from_pdf, copy_images_to_server
+from minio_client import reset_minio_client
+from pdf_image_extractor import extract_images_from_pdf, copy_images_to_server, MAX_UPLOAD_WORKERS
+
+# 并发写入页面文件的线程数
+PAGE_WRITE_WORKERS = 8
+
+def _custom_bucket_name(pdf_filename):
+    """
+    返回特定文档的定制Bucket名称，其他文档返回None（使用自动生成的名称）
+    """
+    if "挖掘机维修案例" in pdf_filename:
+        return "ragflow-excavator-repair"
+    return None
+
+def _write_page(page_doc, base_name):
+    """
+    将单个页面文档写入独立的md文件，返回文件名
+    """
+    page_filename = f"{base_name}_page{page_doc['page']}.md"
+    # 优先写入已编码的UTF-8字节，避免重复编码
+    with open(page_filename, "wb") as f:
+        f.write(page_doc.get('blob') or page_doc['content'].encode('utf-8'))
+    return page_filename
+
+def _init_worker():
+    """
+    子进程初始化：丢弃从父进程继承的MinIO客户端（boto3客户端不能跨fork共享），
+    由get_minio_client在本进程内首次使用时重新创建
+    """
+    load_dotenv()
+    reset_minio_client()
+
+def _process_one(pdf_path, upload_workers=MAX_UPLOAD_WORKERS):
+    """
+    在子进程中处理单个PDF：提取图片并上传MinIO，生成md文件
+    维修案例文档每页生成一个文件，其他文档生成一个_enhanced.md增强文本文件
+
+    返回:
+    - (pdf_path, 生成的文件列表)，处理失败时文件列表为None
+    """
+    pdf_filename = os.path.basename(pdf_path)
+    custom_bucket_name = _custom_bucket_name(pdf_filename)
+    try:
+        page_documents, extracted_images = extract_images_from_pdf(
+            pdf_path,
+            pdf_filename=pdf_filename,
+            custom_bucket_name=custom_bucket_name,
+            upload_workers=upload_workers
+        )
+        base_name = os.path.splitext(pdf_filename)[0]
+        if isinstance(page_documents, str):
+            # 一般文档返回合并后的增强文本
+            enhanced_filename = f"{base_name}_enhanced.md"
+            with open(enhanced_filename, "w", encoding="utf-8") as f:
+                f.write(page_documents)
+            return pdf_path, [enhanced_filename]
+        page_files = [_write_page(page_doc, base_name) for page_doc in page_documents]
+        return pdf_path, page_files
+    except Exception as e:
+        print(f"处理{pdf_path}出错: {str(e)}")
+        return pdf_path, None
+
+def process_many(pdf_paths, processes=None):
+    """
+    使用多进程并行处理多个PDF（PDF解析受GIL限制，多进程才能利用多核）
+    各进程分摊MAX_UPLOAD_WORKERS个上传线程，使MinIO总并发保持在单进程的水平
+    （进程数超过MAX_UPLOAD_WORKERS时每个进程至少保留1个上传线程）
+
+    参数:
+    - pdf_paths: PDF文件路径列表
+    - processes: 进程数，默认为CPU核数（不超过PDF数量）
+
+    返回:
+    - 字典 {pdf_path: 生成的文件列表}，处理失败的PDF对应None
+    """
+    if not pdf_paths:
+        return {}
+
+    processes = min(processes or mp.cpu_count(), len(pdf_paths))
+    upload_workers = max(1, MAX_UPLOAD_WORKERS // processes)
+    print(f"使用{processes}个进程，每个进程{upload_workers}个上传线程")
+
+    with mp.Pool(processes=processes, initializer=_init_worker) as pool:
+        return dict(pool.map(partial(_process_one, upload_workers=upload_workers), pdf_paths))
 
 def main():
     # 加载.env文件中的环境变量
     load_dotenv()
     
     parser = argparse.ArgumentParser(description='处理PDF文件，提取图片并创建RAGFlow知识库')
-    parser.add_argument('pdf_path', help='PDF文件路径')
+    parser.add_argument('pdf_path', help='PDF文件路径；传入目录时并行处理目录下所有PDF（仅提取图片和生成页面文件）')
     parser.add_argument('--api_key', help='RAGFlow API密钥（可选，默认从环境变量获取）')
     parser.add_argument('--image_dir', default='./images', help='本地图片存储目录，默认为./images')
     parser.add_argument('--mount_dir', default='/app/images', help='图片服务器容器内的挂载目录，默认为/app/images')
@@ -24,6 +110,22 @@ def main():
     # 确保本地图片目录存在
     os.makedirs(args.image_dir, exist_ok=True)
     
+    # 目录模式：多进程并行处理所有PDF，不创建RAGFlow知识库
+    if os.path.isdir(args.pdf_path):
+        pdf_paths = sorted(
+            os.path.join(args.pdf_path, name)
+            for name in os.listdir(args.pdf_path)
+            if name.lower().endswith('.pdf')
+        )
+        print(f"并行处理目录中的{len(pdf_paths)}个PDF文件...")
+        results = process_many(pdf_paths)
+        for pdf_path, page_files in results.items():
+            if page_files is None:
+                print(f"- {pdf_path}: 处理失败")
+            else:
+                print(f"- {pdf_path}: 已生成{len(page_files)}个文件")
+        return
+
     # 优先使用命令行参数的API密钥，其次使用环境变量
     api_key = args.api_key or os.getenv('RAGFLOW_API_KEY')
 
@@ -36,9 +138,8 @@ def main():
         print(f"第1步：处理PDF并提取图片...")
         
         # 特殊处理：如果是挖掘机维修案例，强制定制Bucket名称
-        custom_bucket_name = None
-        if "挖掘机维修案例" in pdf_filename:
-            custom_bucket_name = "ragflow-excavator-repair"
+        custom_bucket_name = _custom_bucket_name(pdf_filename)
+        if custom_bucket_name:
             print(f"检测到挖掘机案例，使用定制Bucket名称: {custom_bucket_name}")
             
         page_documents, extracted_images = extract_images_from_pdf(
@@ -53,14 +154,12 @@ def main():
         
         # 保存每个页面为独立的md文件
         print(f"第3步：为每个页面生成独立的md文件...")
-        page_files = []
         base_name = os.path.splitext(os.path.basename(args.pdf_path))[0]
         
-        for page_doc in page_documents:
-            page_filename = f"{base_name}_page{page_doc['page']}.md"
-            with open(page_filename, "w", encoding="utf-8") as f:
-                f.write(page_doc['content'])
-            page_files.append(page_filename)
+        # 并发写入页面文件，map保持与page_documents相同的顺序
+        with ThreadPoolExecutor(max_workers=PAGE_WRITE_WORKERS) as executor:
+            page_files = list(executor.map(lambda page_doc: _write_page(page_doc, base_name), page_documents))
+        for page_filename in page_files:
             print(f"  - 已保存: {page_filename}")
 
         print(f"第4步：共生成{len(page_files)}个页面文件")